@@ -5,12 +5,21 @@ import json
 import re
 import sys
 import unicodedata
+from collections import defaultdict
+from functools import lru_cache
 
-def get_topics(variables):
-    topics = set()
+STRIP_RE = re.compile(r"[^\w\s-]")
+DASH_RE = re.compile(r"[-\s]+")
+# ASCII-only equivalent of STRIP_RE, applied with str.translate
+ASCII_STRIP_TABLE = str.maketrans(
+    "", "", "".join(c for c in map(chr, range(128)) if not (c.isalnum() or c.isspace() or c in "_-"))
+)
+
+def group_by_topic(variables):
+    by_topic = defaultdict(list)
     for variable in variables:
-        topics.add(variable["metadata"]["Topic Area(s)"])
-    return sorted(topics)
+        by_topic[variable["metadata"]["Topic Area(s)"]].append(variable)
+    return by_topic
 
 def summarise_category(category):
     return {
@@ -22,9 +31,9 @@ def summarise_category(category):
         "category_h_pt3": "TODO",
     }
 def summarise_classification(classification, additional_metadata):
-    additional_classification_metadata = next(
-        filter(lambda x: x["Classification_Mnemonic"] == classification["classification_code"].lower(), additional_metadata["classifications"])
-    )
+    additional_classification_metadata = additional_metadata["classifications_by_mnemonic"][
+        classification["classification_code"].lower()
+    ]
     return {
         "code": classification["classification_code"],
         "desc": additional_classification_metadata["External_Classification_Label_English"],
@@ -33,9 +42,9 @@ def summarise_classification(classification, additional_metadata):
     }
 def summarise_variable(variable, additional_metadata):
     metadata = variable["metadata"]
-    additional_variable_metadata = next(
-        filter(lambda x: x["Variable_Mnemonic"] == metadata["2021 Mnemonic (variable)"].lower(), additional_metadata["variables"])
-    )
+    additional_variable_metadata = additional_metadata["variables_by_mnemonic"][
+        metadata["2021 Mnemonic (variable)"].lower()
+    ]
     return {
         "name": metadata["Description"],
         "slug": slugify(metadata["Description"]),
@@ -46,6 +55,7 @@ def summarise_variable(variable, additional_metadata):
         "classifications": [summarise_classification(c, additional_metadata) for c in variable["classifications"]]
     }
     
+@lru_cache(maxsize=4096)
 def slugify(value, allow_unicode=False):
     """
     Convert to ASCII if 'allow_unicode' is False. Convert spaces or repeated
@@ -59,34 +69,49 @@ def slugify(value, allow_unicode=False):
     value = str(value)
     if allow_unicode:
         value = unicodedata.normalize("NFKC", value)
+        value = STRIP_RE.sub("", value.lower())
     else:
-        value = (
-            unicodedata.normalize("NFKD", value)
-            .encode("ascii", "ignore")
-            .decode("ascii")
-        )
-    value = re.sub(r"[^\w\s-]", "", value.lower())
-    return re.sub(r"[-\s]+", "-", value).strip("-_")
+        if not value.isascii():
+            # ASCII strings are unchanged by NFKD folding, so only non-ASCII ones need it
+            value = (
+                unicodedata.normalize("NFKD", value)
+                .encode("ascii", "ignore")
+                .decode("ascii")
+            )
+        value = value.lower().translate(ASCII_STRIP_TABLE)
+    return DASH_RE.sub("-", value).strip("-_")
 
-def get_vars_by_topic(topic, variables, additional_metadata):
-    result = []
-    for variable in variables:
-        if variable["metadata"]["Topic Area(s)"] == topic:
-            result.append(summarise_variable(variable, additional_metadata))
-    return result
+def index_by_column(rows, key_column):
+    """Index rows by the exact value in key_column; the first row with a given value wins."""
+    index = {}
+    for row in rows:
+        index.setdefault(row[key_column], row)
+    return index
+
+def read_csv_columns(csv_filename, columns):
+    with open(csv_filename, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return []
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError(f"{csv_filename} is missing column(s): {', '.join(missing)}")
+        col_indices = [header.index(c) for c in columns]
+        # short rows get None for missing trailing fields, as csv.DictReader gives them
+        return [
+            {c: row[i] if i < len(row) else None for c, i in zip(columns, col_indices)} for row in reader if row
+        ]
 
 def load_additional_metadata():
     meta = {}
-    for key, meta_file in {
-        "topics": "Topic.csv", 
-        "variables": "Variable.csv", 
-        "classifications": 
-        "Classification.csv", 
-        "categories": "Category.csv"
+    for key, (meta_file, columns) in {
+        "variables": ("Variable.csv", ("Variable_Mnemonic", "Variable_Description", "Statistical_Unit")),
+        "classifications": ("Classification.csv", ("Classification_Mnemonic", "External_Classification_Label_English")),
     }.items():
-        with open(meta_file, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            meta[key] = list(reader)
+        meta[key] = read_csv_columns(meta_file, columns)
+    meta["variables_by_mnemonic"] = index_by_column(meta["variables"], "Variable_Mnemonic")
+    meta["classifications_by_mnemonic"] = index_by_column(meta["classifications"], "Classification_Mnemonic")
     return meta
 
 def main():
@@ -94,18 +119,18 @@ def main():
         variables = json.load(f)
 
     additional_metadata = load_additional_metadata()
-    topics = get_topics(variables)
+    by_topic = group_by_topic(variables)
     result = [
         {
             "name": topic,
             "slug": slugify(topic),
             "desc": "TODO desc",
-            "variables": get_vars_by_topic(topic, variables, additional_metadata)
+            "variables": [summarise_variable(v, additional_metadata) for v in by_topic[topic]]
         }
-        for topic in topics
+        for topic in sorted(by_topic)
     ]
     with open(sys.argv[2], "w") as f:
-        json.dump(result, f)
+        f.write(json.dumps(result))
 
 if __name__=="__main__":
     main()
@@ -6,6 +6,7 @@ import json
 import re
 import sys
 import unicodedata
+from functools import lru_cache
 
 from openpyxl import load_workbook
 
@@ -17,20 +18,36 @@ DEFAULT_CLASS_COLUMN = "Default classification"
 DOT_DENSITY_CLASS_COLUMN = "Dot density classification"
 COMPARISON_2011_COLUMN = "2011 comparability?"
 
-NON_ENTITIES = ("return to index", "does not apply")
+NON_ENTITIES = frozenset(("return to index", "does not apply"))
+CAT_Q_CODE_RANGE_TABLE = str.maketrans({"–": "-", ">": "-"})
+
+STRIP_RE = re.compile(r"[^\w\s-]")
+DASH_RE = re.compile(r"[-\s]+")
+# ASCII-only equivalent of STRIP_RE, applied with str.translate
+ASCII_STRIP_TABLE = str.maketrans(
+    "", "", "".join(c for c in map(chr, range(128)) if not (c.isalnum() or c.isspace() or c in "_-"))
+)
 
 
 # ==================================================== UTILITIES ===================================================== #
 
 
-def cmp_strings(str1, str2):
-    return str1.lower().strip() == str2.lower().strip()
+def norm_key(string):
+    return string.lower().strip()
 
 
-def cmp_string_to_list(string, strList):
-    return any(cmp_strings(string, str2) for str2 in strList)
+def index_metadata(rows, *key_columns):
+    """Index rows by the norm_key of each key column (lower-cased, stripped); the first row with a given key wins."""
+    index = {}
+    for row in rows:
+        for col in key_columns:
+            key = norm_key(row[col]) if row[col] is not None else ""
+            if key:
+                index.setdefault(key, row)
+    return index
 
 
+@lru_cache(maxsize=4096)
 def slugify(value, allow_unicode=False):
         """
         Convert to ASCII if 'allow_unicode' is False. Convert spaces or repeated
@@ -44,69 +61,90 @@ def slugify(value, allow_unicode=False):
         value = str(value)
         if allow_unicode:
             value = unicodedata.normalize("NFKC", value)
+            value = STRIP_RE.sub("", value.lower())
         else:
-            value = (
-                unicodedata.normalize("NFKD", value)
-                .encode("ascii", "ignore")
-                .decode("ascii")
-            )
-        value = re.sub(r"[^\w\s-]", "", value.lower())
-        return re.sub(r"[-\s]+", "-", value).strip("-_")
+            if not value.isascii():
+                # ASCII strings are unchanged by NFKD folding, so only non-ASCII ones need it
+                value = (
+                    unicodedata.normalize("NFKD", value)
+                    .encode("ascii", "ignore")
+                    .decode("ascii")
+                )
+            value = value.lower().translate(ASCII_STRIP_TABLE)
+        return DASH_RE.sub("-", value).strip("-_")
+
+
+def read_csv_columns(csv_filename, columns):
+    with open(csv_filename, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return []
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError(f"{csv_filename} is missing column(s): {', '.join(missing)}")
+        col_indices = [header.index(c) for c in columns]
+        # short rows get None for missing trailing fields, as csv.DictReader gives them
+        return [
+            {c: row[i] if i < len(row) else None for c, i in zip(columns, col_indices)} for row in reader if row
+        ]
 
 
 def load_metadata():
     meta = {}
-    for key, meta_file in {
-        "topics": "Topic.csv", 
-        "variables": "Variable.csv", 
-        "classifications": "Classification.csv",
-        "categories": "Category.csv"
+    for key, (meta_file, columns) in {
+        "topics": ("Topic.csv", ("Topic_Mnemonic", "Topic_Description", "Topic_Title")),
+        "variables": ("Variable.csv", ("Variable_Mnemonic", "Variable_Title", "Variable_Description", "Statistical_Unit")),
+        "classifications": ("Classification.csv", ("Classification_Mnemonic", "External_Classification_Label_English")),
     }.items():
-        with open(meta_file, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            meta[key] = list(reader)
-    return meta    
+        meta[key] = read_csv_columns(meta_file, columns)
+    meta["topics_by_key"] = index_metadata(meta["topics"], "Topic_Mnemonic", "Topic_Description", "Topic_Title")
+    meta["variables_by_mnemonic"] = index_metadata(meta["variables"], "Variable_Mnemonic")
+    meta["classifications_by_mnemonic"] = index_metadata(meta["classifications"], "Classification_Mnemonic")
+    return meta
 
 
 # ================================================= TOPIC PROCESSING ================================================= #
 
 
-def get_topics(wb, metadata):
-    config_rows = worksheet_to_row_dicts(wb[CONFIG_WORKSHEET])
-    topics = []
-    for cr in config_rows:
-        name_or_mnemonic = cr[TOPIC_NAME_COLUMN].value
+def get_topics(sheets, metadata):
+    config_rows = get_config_rows(sheets[CONFIG_WORKSHEET])
+    topics_by_name = {}
+    for cr, var_sheet_name in config_rows:
+        name_or_mnemonic = cr[TOPIC_NAME_COLUMN]
         if name_or_mnemonic is None:
-            print(f"No topic name found for row {list(filter(lambda x: x, [c.value for c in cr.values()]))}, cannot process")
+            print(f"No topic name found for row {[v for v in cr.values() if v]}, cannot process")
             continue
         topic_content = get_topic_content(name_or_mnemonic, metadata)
         # each topic row is also a variable row, so get those
-        topic_row_variable = get_variable(wb, metadata, cr)
-        seen_topic = next(filter(lambda t: topic_content["name"] == t["name"], topics), None)
-        if seen_topic:
-            seen_topic["variables"].append(topic_row_variable)
-        else:
-            topic_content["variables"].append(topic_row_variable)
-            topics.append(topic_content)
-    return topics
+        topic_row_variable = get_variable(sheets, metadata, cr, var_sheet_name)
+        topic = topics_by_name.setdefault(topic_content["name"], topic_content)
+        topic["variables"].append(topic_row_variable)
+    return list(topics_by_name.values())
+
 
+def get_config_rows(ws):
+    rows = ws.iter_rows()
+    colnames = [cell.value for cell in next(rows)]
+    var_code_index = colnames.index(VARIABLE_CODE_COLUMN)
+    for row in rows:
+        values = [cell.value for cell in row]
+        if any(v is not None for v in values):
+            # the variable code cell links to the variable's worksheet, which is the only cell attribute we need
+            yield dict(zip(colnames, values)), sheet_name_from_hyperlink(row[var_code_index].hyperlink)
 
-def worksheet_to_row_dicts(ws):
-    rows = ws.rows
-    header_row = next(rows)
-    colnames = [cell.value for cell in header_row]
-    return [dict(zip(colnames, row)) for row in rows if not all (c.value == None for c in row)]
+
+def sheet_name_from_hyperlink(hyperlink):
+    if hyperlink is None:
+        return None
+    return hyperlink.location.partition('!')[0].replace("'", "")
 
 
 def get_topic_content(name_or_mnemonic, metadata):
-    topic_metadata = [
-        m for m in metadata["topics"] if cmp_string_to_list(
-            name_or_mnemonic, (m["Topic_Mnemonic"], m["Topic_Description"], m["Topic_Title"])
-        )
-    ]
+    topic_metadata = metadata["topics_by_key"].get(norm_key(name_or_mnemonic))
     if topic_metadata:
-        topic_name = topic_metadata[0]["Topic_Title"].strip()
-        topic_desc = topic_metadata[0]["Topic_Description"].strip()
+        topic_name = topic_metadata["Topic_Title"].strip()
+        topic_desc = topic_metadata["Topic_Description"].strip()
     else:
         topic_name = name_or_mnemonic
         topic_desc = "not found in topic metadata!"
@@ -121,16 +159,14 @@ def get_topic_content(name_or_mnemonic, metadata):
 # =============================================== VARIABLE PROCESSING ================================================ #
 
 
-def get_variable(wb, metadata, config_row):
-    var_code_cell = config_row[VARIABLE_CODE_COLUMN]
-    if var_code_cell.hyperlink is None:
-        print(f"Ignoring variable {var_code_cell.value} as it does not link to a variable in spreadsheet.")
+def get_variable(sheets, metadata, config_row, var_code_from_hyperlink):
+    if var_code_from_hyperlink is None:
+        print(f"Ignoring variable {config_row[VARIABLE_CODE_COLUMN]} as it does not link to a variable in spreadsheet.")
         return
-    var_code_from_hyperlink = var_code_cell.hyperlink.location.split('!')[0].replace("'", "")
     variable_content = get_variable_content(var_code_from_hyperlink, metadata)
-    variable_content["classifications"] = get_classifications(wb, metadata, variable_content, config_row)
+    variable_content["classifications"] = get_classifications(sheets, metadata, variable_content, config_row)
     
-    default_class_suffix = config_row[DEFAULT_CLASS_COLUMN].value.replace("(only one classification)", "").strip()
+    default_class_suffix = config_row[DEFAULT_CLASS_COLUMN].replace("(only one classification)", "").strip()
     default_class = class_code_from_suffix(variable_content["classifications"], default_class_suffix)
     if default_class:
         variable_content["default_classification"] = default_class[0]
@@ -138,7 +174,7 @@ def get_variable(wb, metadata, config_row):
         variable_content["default_classification"] = "not found in variables!"
         print(f"Default classification {default_class_suffix} could not be found in for variable {variable_content['code']}")
     
-    dot_density_class_suffix = config_row[DOT_DENSITY_CLASS_COLUMN].value.strip()
+    dot_density_class_suffix = config_row[DOT_DENSITY_CLASS_COLUMN].strip()
     if dot_density_class_suffix.lower() == "no":
         variable_content["dot_density_classification"] = "false"
     else:
@@ -149,7 +185,7 @@ def get_variable(wb, metadata, config_row):
             variable_content["dot_density_classification"] = "not found in variables!"
             print(f"Dot density classification {dot_density_class_suffix} could not be found in for variable {variable_content['code']}")
 
-    comp_2011 = config_row[COMPARISON_2011_COLUMN].value
+    comp_2011 = config_row[COMPARISON_2011_COLUMN]
     if comp_2011:
         variable_content["2011_comparison"] = comp_2011.replace("no", "false").replace("yes", "true")
     else:
@@ -159,11 +195,11 @@ def get_variable(wb, metadata, config_row):
 
 
 def get_variable_content(code, metadata):
-    var_metadata = [m for m in metadata["variables"] if cmp_strings(code, m["Variable_Mnemonic"])]
+    var_metadata = metadata["variables_by_mnemonic"].get(norm_key(code))
     if var_metadata:
-        var_name = var_metadata[0]["Variable_Title"].strip()
-        var_desc = var_metadata[0]["Variable_Description"].strip()
-        var_units = var_metadata[0]["Statistical_Unit"].strip()
+        var_name = var_metadata["Variable_Title"].strip()
+        var_desc = var_metadata["Variable_Description"].strip()
+        var_units = var_metadata["Statistical_Unit"].strip()
     else:
         var_name = code.replace("_", " ").strip().title()
         var_desc = "not found in variable metadata!"
@@ -180,37 +216,40 @@ def get_variable_content(code, metadata):
 
 
 def class_code_from_suffix(classifications, suffix):
-    return [c["code"] for c in classifications if c["code"].lower().endswith(suffix.lower())]
+    suffix = suffix.lower()
+    return [c["code"] for c in classifications if c["code"].lower().endswith(suffix)]
 
 
 # ============================================ CLASSIFICATION PROCESSING ============================================= #
 
-def get_classifications(wb, metadata, variable, config_row):
-    class_worksheet = wb[variable["code"]]
-    col_headers = [cell.value for cell in next(class_worksheet.rows)]
-    all_class_in_worksheet = [h for h in col_headers if isinstance(h, str) and h.lower() not in NON_ENTITIES]
+def get_classifications(sheets, metadata, variable, config_row):
+    class_worksheet = sheets[variable["code"]]
+    col_headers = next(class_worksheet.iter_rows(max_row=1, values_only=True))
 
-    required_class_str = config_row[CLASS_TO_KEEP_COLUMN].value
-    if required_class_str == "all":
-        class_to_process = all_class_in_worksheet
-    else:
-        required_class = [x.strip() for x in required_class_str.split(",")]
-        class_to_process = [c for c in all_class_in_worksheet if any(c.endswith(rc) for rc in required_class)]
-    
-    class_data_cols_index = [{"code": c, "cat_q_codes_col": i, "cat_name_col": i+1} for i, c in enumerate(col_headers) if c in class_to_process]
+    required_class_str = config_row[CLASS_TO_KEEP_COLUMN]
+    keep_all_class = required_class_str == "all"
+    required_class = () if keep_all_class else tuple(x.strip() for x in required_class_str.split(","))
+
+    class_data_cols_index = [
+        {"code": h, "cat_q_codes_col": i, "cat_name_col": i+1} for i, h in enumerate(col_headers)
+        if isinstance(h, str) and h.lower() not in NON_ENTITIES and (keep_all_class or h.endswith(required_class))
+    ]
     classifications = []
     for c in class_data_cols_index:
         class_content = get_classification_content(c["code"], metadata)
-        class_content["categories"] = get_categories(class_worksheet, c["cat_q_codes_col"], c["cat_name_col"], metadata, config_row)
+        cat_q_codes_cells, cat_name_cells = class_worksheet.iter_cols(
+            min_col=c["cat_q_codes_col"] + 1, max_col=c["cat_name_col"] + 1
+        )
+        class_content["categories"] = get_categories(cat_q_codes_cells, cat_name_cells, metadata, config_row)
         classifications.append(class_content)
     return classifications
 
 
 def get_classification_content(code, metadata):
     code = code.replace(" ", "")
-    class_metadata = [m for m in metadata["classifications"] if cmp_strings(code, m["Classification_Mnemonic"])]
+    class_metadata = metadata["classifications_by_mnemonic"].get(norm_key(code))
     if class_metadata:
-        class_desc = class_metadata[0]["External_Classification_Label_English"].strip()
+        class_desc = class_metadata["External_Classification_Label_English"].strip()
     else:
         class_desc = "not found in classification metadata!"
         print(f"No metadata found for classification {code}")
@@ -225,35 +264,37 @@ def get_classification_content(code, metadata):
 # ================================================ CATEGORY PROCESSING =============================================== #
 
 
-def get_categories(ws, cat_q_codes_col, cat_name_col, metadata, config_row):
-    cat_q_codes = [norm_cat_q_codes(cell.value) for cell in list(ws.columns)[cat_q_codes_col] if is_bordered_cell(cell)]
-    cat_names = [cell.value for cell in list(ws.columns)[cat_name_col] if is_bordered_cell(cell)]
+def get_categories(cat_q_codes_cells, cat_name_cells, metadata, config_row):
     categories = []
-    for q_codes, name  in zip(cat_q_codes, cat_names):
-        if name.lower() not in NON_ENTITIES:
+    for q_codes_cell, name_cell in zip(cat_q_codes_cells, cat_name_cells):
+        is_category = is_bordered_cell(q_codes_cell)
+        if is_category != is_bordered_cell(name_cell):
+            print(f"Category cells {q_codes_cell.coordinate} and {name_cell.coordinate} are not both bordered, skipping")
+            continue
+        name = name_cell.value
+        if is_category and name.lower() not in NON_ENTITIES:
+            slug = slugify(name)
             categories.append(
                 {
                     "name": name,
-                    "slug": slugify(name),
-                    "code": make_cat_code(q_codes, name)
+                    "slug": slug,
+                    "code": make_cat_code(norm_cat_q_codes(q_codes_cell.value), slug)
                 }
             )
     return categories
 
 
 def norm_cat_q_codes(cat_q_code_str):
-    cat_q_code_str = "".join(str(cat_q_code_str).split())
-    for to_replace in ("–", ">"):
-        cat_q_code_str = cat_q_code_str.replace(to_replace, "-")
-    return cat_q_code_str
+    return "".join(str(cat_q_code_str).split()).translate(CAT_Q_CODE_RANGE_TABLE)
 
 
 def is_bordered_cell(cell):
-    return cell.border.left.style is not None and cell.border.right.style is not None
+    border = cell.border
+    return border.left.style is not None and border.right.style is not None
 
 
-def make_cat_code(cat_q_codes, cat_name):
-    return f"{slugify(cat_name)}={cat_q_codes}" 
+def make_cat_code(cat_q_codes, cat_slug):
+    return f"{cat_slug}={cat_q_codes}"
 
 
 # ======================================================= MAIN ======================================================= #
@@ -261,8 +302,10 @@ def make_cat_code(cat_q_codes, cat_name):
 def main():
     workbook_filename = sys.argv[1]
     wb = load_workbook(workbook_filename)
+    # wb[title] scans worksheets and chartsheets linearly, so index both by title once
+    sheets = {ws.title: ws for ws in wb.worksheets + wb.chartsheets}
     metadata = load_metadata()
-    topics = get_topics(wb, metadata)
+    topics = get_topics(sheets, metadata)
     with open(sys.argv[2], "w") as f:
         json.dump(topics, f, indent=4)
 
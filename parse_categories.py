@@ -9,10 +9,13 @@ from openpyxl import load_workbook
 
 WORKBOOK_FILENAME = "Output_Category_Mapping_2021.xlsx"
 SELECTED_TABLES_CSV = "selected-tables.csv"
-NON_ENTITIES = ("return to index", "does not apply")
+NON_ENTITIES = frozenset(("return to index", "does not apply"))
 VARIABLE_OVERRIDES = {
     "DWELLING_HMO_UNRELATED (WAS HH_MULTI_OCCUPANCY)": "DWELLING_HMO_UNRELATED"
 }
+DIGITS_RE = re.compile('^[0-9]*$')
+CODE_START_RE = re.compile('^[-0-9]')
+UPPERCASE_RE = re.compile('[A-Z]')
 
 def expand_range(code, sep):
     endpoints = code.split(sep)
@@ -34,7 +37,7 @@ def with_ranges_expanded(codes):
         elif '–' in code:
             result.extend(expand_range(code, '–'))
         else:
-            if re.compile('^[0-9]*$').match(code) is None:
+            if DIGITS_RE.match(code) is None:
                 raise ValueError("Unexpected code: " + code)
             result.append(int(code))
     return result
@@ -49,21 +52,18 @@ def extract_categories(sheet, column):
     categories = []
 
     found_categories = False
-    row = 2
-    while row < 1000:
-        val = sheet.cell(row, column).value
-        if re.search('^[-0-9]', str(val)) and sheet.cell(row, column + 1).value.lower() not in NON_ENTITIES:
+    for val, name in sheet.iter_rows(min_row=2, max_row=999, min_col=column, max_col=column + 1, values_only=True):
+        if CODE_START_RE.search(str(val)) and name.lower() not in NON_ENTITIES:
             codes_str = str(val).strip().replace(" ", "")
             codes = parse_category_codes(val)
             categories.append({
                 "codes": codes,
-                "name": sheet.cell(row, column + 1).value
+                "name": name
             })
         elif val is not None:
             extra_strings.append(str(val))
         elif found_categories:
             break
-        row += 1
     return {"extra_strings": extra_strings, "categories": categories}
 
 def parse_sheet(sheet, var_details_map, selected_vars):
@@ -78,13 +78,13 @@ def parse_sheet(sheet, var_details_map, selected_vars):
     selected_categories = selected_vars[title_as_in_index]
     number_of_selected_categories_parsed = 0    # to check we found all of the requested cats
 
-    rows = [row for row in sheet.rows]
+    header_row = next(sheet.iter_rows(max_row=1))
 
     classifications = []
     selected_default = False
 
-    for cell in rows[0]:
-        if isinstance(cell.value, str) and re.search('[A-Z]', cell.value) and cell.value.lower() not in NON_ENTITIES:
+    for cell in header_row:
+        if isinstance(cell.value, str) and UPPERCASE_RE.search(cell.value) and cell.value.lower() not in NON_ENTITIES:
             short_category_code = cell.value.strip().split("_")[-1]
             if selected_categories[0] == "all" or short_category_code in selected_categories:
                 classification = extract_categories(sheet, cell.column)
@@ -108,30 +108,27 @@ def parse_index_table(sheet):
     var_details_map = {}
     column_names = []
 
-    col = 1
-    while True:
-        value = sheet.cell(2, col).value
-        if value is None:
+    rows = sheet.iter_rows(min_row=2)
+    for cell in next(rows, ()):
+        if cell.value is None:
             break
-        column_names.append(value)
-        col += 1
-
-    row = 3
-    while sheet.cell(row, 1).value is not None:
-        for i, column_name in enumerate(column_names):
-            column = i + 1
-            value = sheet.cell(row, column).value
+        column_names.append(cell.value)
+
+    for row in rows:
+        if row[0].value is None:
+            break
+        for column_name, cell in zip(column_names, row):
+            value = cell.value
             if value is None:
                 value = ""
-            if column == 1:
+            if cell.column == 1:
                 value = value.upper()
                 sheet_name = value
-                if sheet.cell(row, column).hyperlink is not None:
-                    sheet_name = sheet.cell(row, column).hyperlink.location.split('!')[0].upper().replace("'", "")
+                if cell.hyperlink is not None:
+                    sheet_name = cell.hyperlink.location.partition('!')[0].upper().replace("'", "")
                 d = {"variable_name": sheet_name}
                 var_details_map[sheet_name] = d
             d[column_name] = value
-        row += 1
 
     return var_details_map
 
@@ -153,14 +150,15 @@ def main():
     selected_vars = parse_selected_vars(selected_tables_csv)
     wb = load_workbook(workbook_filename)
     sheetnames = wb.sheetnames
+    sheets = {ws.title: ws for ws in wb.worksheets + wb.chartsheets}
 
-    var_details_map = parse_index_table(wb['INDEX'])
+    var_details_map = parse_index_table(sheets['INDEX'])
 
     variable_sheetnames = sheetnames[3:]
     variables = []
 
     for sheetname in variable_sheetnames:
-        var_data = parse_sheet(wb[sheetname], var_details_map, selected_vars)
+        var_data = parse_sheet(sheets[sheetname], var_details_map, selected_vars)
         if var_data is not None:
             variables.append(var_data)
 